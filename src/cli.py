@@ -9,6 +9,11 @@ def main():
     parser = argparse.ArgumentParser(description='AlzGen Insight CLI')
     parser.add_argument('--input', type=str, required=True, help='JSON input file')
     parser.add_argument('--output', type=str, default='report.pdf', help='Output PDF path')
+    parser.add_argument('--interval', action='store_true', help='Report a confidence interval on the risk')
+    parser.add_argument('--confidence', type=float, default=0.9, help='Confidence level for --interval')
+    parser.add_argument('--prs-mode', type=str, choices=['append', 'replace'], default=None,
+                        help="Use the patient's precomputed 'prs' next to or instead of the 11-gene features")
+    parser.add_argument('--model', type=str, default='models/risk_model.pkl', help='Model file')
     args = parser.parse_args()
 
     # load patient data
@@ -16,14 +21,17 @@ def main():
         patient = json.load(f)
     
     # initialize engines
-    risk_engine = PolygenicRiskEngine()
+    risk_engine = PolygenicRiskEngine(model_path=args.model, prs_mode=args.prs_mode)
     drug_analyzer = PharmacogenomicsAnalyzer()
     
     # process data
     risk_result = risk_engine.calculate_score(
         genotype=patient['genotype'],
         age_group=patient['age_group'],
-        medications=patient.get('medications', [])
+        medications=patient.get('medications', []),
+        return_interval=args.interval,
+        confidence=args.confidence,
+        prs=patient.get('prs')
     )
     
     drug_result = drug_analyzer.check_interactions(
@@ -37,6 +45,9 @@ def main():
     
     print(f"Report generated: {report_path}")
     print(f"Risk Assessment: {risk_result['risk_category']} ({risk_result['adjusted_risk']:.1f}%)")
+    if args.interval:
+        low, high = risk_result['adjusted_risk_interval']
+        print(f"{args.confidence*100:.0f}% Interval: {low:.1f}% - {high:.1f}%")
     
     if drug_result['warnings']:
         print("\nMedication Warnings:")
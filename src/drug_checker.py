@@ -1,12 +1,18 @@
 # genix_alz/src/drug_checker.py
 import json
+from medication_normalizer import MedicationNormalizer
 
 class PharmacogenomicsAnalyzer:
-    def __init__(self, rules_path='data/drug_interactions.json'):
+    def __init__(self, rules_path='data/drug_interactions.json',
+                 synonyms_path='data/medication_synonyms.json'):
         with open(rules_path) as f:
             self.rules = json.load(f)
+        rule_names = {med for variants in self.rules.values() for med in variants if med != 'alternatives'}
+        self.normalizer = MedicationNormalizer(synonyms_path, extra_names=sorted(rule_names))
     
     def check_interactions(self, genotype, medications):
+        # brand names, dose suffixes and class members are mapped onto the rule names first
+        medications = self.normalizer.normalize_medications(medications)
         warnings = []
         recommendations = []
         
@@ -33,3 +39,7 @@ class PharmacogenomicsAnalyzer:
             'warnings': warnings,
             'recommendations': recommendations
         }
+
+    def check_interactions_batch(self, patients):
+        """check_interactions for many patients; repeated medication strings hit the normalizer cache"""
+        return [self.check_interactions(p['genotype'], p.get('medications', [])) for p in patients]
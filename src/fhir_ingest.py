@@ -0,0 +1,308 @@
+# genix_alz/src/fhir_ingest.py
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from collections import Counter
+from joblib import Parallel, delayed, effective_n_jobs
+from risk_calculator import ALZ_GENES, PolygenicRiskEngine
+from drug_checker import PharmacogenomicsAnalyzer
+from file_utils import atomic_write, iter_lines_in_range, split_byte_ranges
+
+# LOINC codes from the HL7 Genomics Reporting IG
+LOINC_GENE_STUDIED = '48018-6'
+LOINC_GENOTYPE_DISPLAY = '84413-4'
+
+MEDICATION_RESOURCES = ('MedicationStatement', 'MedicationRequest')
+# statuses that mean the patient is not (or was never) taking the medication
+INACTIVE_MEDICATION_STATUSES = {'entered-in-error', 'cancelled', 'stopped', 'not-taken'}
+# Observation statuses without a usable result
+INVALID_OBSERVATION_STATUSES = {'entered-in-error', 'cancelled', 'registered'}
+# when a patient has several Observations for one gene, the most settled status wins, then the latest
+OBSERVATION_STATUS_RANK = {'final': 2, 'amended': 2, 'corrected': 2}
+
+_APOE_ALLELE_PATTERN = re.compile(r'e([234])')
+
+
+def normalize_genotype(gene, value):
+    """Map a genotype string from an Observation onto the ALZ_GENES notation, or None"""
+    known = ALZ_GENES[gene]
+    if gene == 'APOE':
+        alleles = sorted(_APOE_ALLELE_PATTERN.findall(value.lower().replace('ε', 'e')))
+        genotype = f"e{alleles[0]}/e{alleles[1]}" if len(alleles) == 2 else None
+        return genotype if genotype in known else None
+    bases = re.sub(r'[^ACGT]', '', value.upper())
+    for genotype in (bases, bases[::-1]):
+        if genotype in known:
+            return genotype
+    return None
+
+
+def age_group_for(birth_date, reference_date):
+    """Age group at reference_date for a FHIR date ('YYYY', 'YYYY-MM' or 'YYYY-MM-DD'), or None under 50"""
+    parts = [int(p) for p in birth_date[:10].split('-')]
+    year, month, day = (parts + [1, 1])[:3]
+    age = reference_date.year - year - ((reference_date.month, reference_date.day) < (month, day))
+    if age < 50:
+        return None
+    if age >= 80:
+        return '80+'
+    decade = age // 10 * 10
+    return f"{decade}-{decade + 9}"
+
+
+def _reference_id(reference, resource_type='Patient'):
+    """Id from a reference of the form [base/]Type/id[/_history/version], "urn:uuid:id" or a bare id.
+
+    Returns None when the reference points at a resource of another type.
+    """
+    value = reference.get('reference', '').strip()
+    if value.startswith('urn:'):
+        return value.rsplit(':', 1)[-1] or None
+    parts = value.split('/')
+    if len(parts) >= 4 and parts[-2] == '_history':
+        parts = parts[:-2]
+    if len(parts) > 1 and parts[-2] != resource_type:
+        return None
+    return parts[-1] or None
+
+
+def _codeable_text(concept):
+    if not concept:
+        return None
+    if concept.get('text'):
+        return concept['text']
+    for coding in concept.get('coding', []):
+        if coding.get('display') or coding.get('code'):
+            return coding.get('display') or coding.get('code')
+    return None
+
+
+def _has_code(concept, code):
+    return any(coding.get('code') == code for coding in (concept or {}).get('coding', []))
+
+
+def parse_genotype_observation(resource):
+    """(gene, genotype) from a genomics Observation, or None if it is not about an ALZ_GENES locus"""
+    if resource.get('status') in INVALID_OBSERVATION_STATUSES:
+        return None
+    gene, value = None, None
+    for component in resource.get('component', []):
+        if _has_code(component.get('code'), LOINC_GENE_STUDIED):
+            gene = _codeable_text(component.get('valueCodeableConcept'))
+        elif _has_code(component.get('code'), LOINC_GENOTYPE_DISPLAY):
+            value = _codeable_text(component.get('valueCodeableConcept')) or component.get('valueString')
+    if gene is None:
+        # simpler exports put the gene symbol in Observation.code
+        gene = _codeable_text(resource.get('code'))
+    value = value or resource.get('valueString') or _codeable_text(resource.get('valueCodeableConcept'))
+
+    gene = next((g for g in ALZ_GENES if gene and g.lower() == gene.strip().lower()), None)
+    if gene is None or not value:
+        return None
+    genotype = normalize_genotype(gene, value)
+    return (gene, genotype) if genotype else None
+
+
+def observation_precedence(resource):
+    """Sort key of a genotype Observation, higher wins when one gene is reported more than once"""
+    period = resource.get('effectivePeriod', {})
+    when = (resource.get('effectiveDateTime') or resource.get('effectiveInstant')
+            or period.get('end') or period.get('start') or resource.get('issued') or '')
+    return [OBSERVATION_STATUS_RANK.get(resource.get('status'), 1), when]
+
+
+def parse_medication(resource):
+    if resource.get('status') in INACTIVE_MEDICATION_STATUSES:
+        return None
+    concept = resource.get('medicationCodeableConcept') or resource.get('medication', {}).get('concept')
+    name = _codeable_text(concept)
+    if name is None:
+        reference = resource.get('medicationReference') or resource.get('medication', {}).get('reference')
+        name = (reference or {}).get('display')
+    return name
+
+
+def _partition_range(path, start, end, work_dir, task_id, n_partitions, reference_date):
+    """Parse one byte range of an NDJSON file and spill compact records into per-patient-hash partitions"""
+    counts = Counter()
+    outputs = {}
+
+    def emit(patient_id, record):
+        k = zlib.crc32(patient_id.encode()) % n_partitions
+        if k not in outputs:
+            outputs[k] = open(os.path.join(work_dir, f'part-{k:04d}-{task_id:05d}.jsonl'), 'w')
+        outputs[k].write(json.dumps([patient_id] + record) + '\n')
+
+    try:
+        with open(path, 'rb') as f:
+            for line in iter_lines_in_range(f, start, end):
+                if not line.strip():
+                    continue
+                try:
+                    resource = json.loads(line)
+                except ValueError:
+                    counts['invalid_lines'] += 1
+                    continue
+
+                resource_type = resource.get('resourceType')
+                if resource_type == 'Patient' and resource.get('id'):
+                    try:
+                        age_group = age_group_for(resource['birthDate'], reference_date)
+                    except (KeyError, ValueError):
+                        age_group = None
+                    emit(resource['id'], ['P', age_group])
+                elif resource_type == 'Observation':
+                    parsed = parse_genotype_observation(resource)
+                    patient_id = _reference_id(resource.get('subject', {}))
+                    if parsed and patient_id:
+                        emit(patient_id, ['G', *parsed, observation_precedence(resource)])
+                elif resource_type in MEDICATION_RESOURCES:
+                    name = parse_medication(resource)
+                    patient_id = _reference_id(resource.get('subject', {}))
+                    if name and patient_id:
+                        emit(patient_id, ['M', name])
+                counts[resource_type or 'unknown'] += 1
+    finally:
+        for f in outputs.values():
+            f.close()
+    return counts
+
+
+class FhirBulkIngestor:
+    def __init__(self, reference_date=None, batch_size=1000, n_partitions=64,
+                 chunk_bytes=64 * 1024 ** 2, n_jobs=-1, work_dir=None):
+        """Stream FHIR Bulk Data NDJSON exports into scoring batches.
+
+        Files are cut into byte ranges parsed in parallel, and every resource is
+        spilled to one of n_partitions temporary files by a hash of its patient id.
+        Each partition is then joined on its own, so memory is bounded by roughly
+        1/n_partitions of the export rather than by the whole export.
+        """
+        self.reference_date = reference_date or datetime.date.today()
+        self.batch_size = batch_size
+        self.n_partitions = n_partitions
+        self.chunk_bytes = chunk_bytes
+        self.n_jobs = n_jobs
+        self.work_dir = work_dir
+        self.stats = Counter()
+
+    def batches(self, paths):
+        """Yield lists of patient dicts shaped like data/sample_patient.json"""
+        work_dir = tempfile.mkdtemp(prefix='genix_fhir_', dir=self.work_dir)
+        try:
+            tasks = [(path, start, end) for path in paths for start, end in split_byte_ranges(path, self.chunk_bytes)]
+            n_jobs = min(effective_n_jobs(self.n_jobs), max(1, len(tasks)))
+            for counts in Parallel(n_jobs=n_jobs)(
+                delayed(_partition_range)(path, start, end, work_dir, task_id, self.n_partitions, self.reference_date)
+                for task_id, (path, start, end) in enumerate(tasks)
+            ):
+                self.stats.update(counts)
+
+            batch = []
+            for k in range(self.n_partitions):
+                for patient in self._join_partition(work_dir, k):
+                    batch.append(patient)
+                    if len(batch) == self.batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _join_partition(self, work_dir, k):
+        patients = {}
+        # sorted by task, i.e. file and byte order, so the join does not depend on directory listing order
+        part_paths = sorted(glob.glob(os.path.join(work_dir, f'part-{k:04d}-*.jsonl')))
+        for part_path in part_paths:
+            with open(part_path) as f:
+                for line in f:
+                    patient_id, kind, *values = json.loads(line)
+                    patient = patients.setdefault(patient_id, {'age_group': None, 'seen': False, 'genotype': {},
+                                                               'precedence': {}, 'medications': []})
+                    if kind == 'P':
+                        patient['seen'] = True
+                        patient['age_group'] = values[0]
+                    elif kind == 'G':
+                        gene, genotype, precedence = values
+                        # ties keep the earlier Observation in export order
+                        if gene not in patient['genotype'] or precedence > patient['precedence'][gene]:
+                            patient['genotype'][gene] = genotype
+                            patient['precedence'][gene] = precedence
+                    else:
+                        patient['medications'].append(values[0])
+            os.remove(part_path)
+
+        for patient_id, patient in patients.items():
+            if not patient['seen']:
+                self.stats['skipped_no_patient_resource'] += 1
+            elif patient['age_group'] is None:
+                self.stats['skipped_age'] += 1
+            elif not patient['genotype']:
+                self.stats['skipped_no_genotype'] += 1
+            else:
+                self.stats['patients'] += 1
+                yield {
+                    'id': patient_id,
+                    'age_group': patient['age_group'],
+                    'genotype': patient['genotype'],
+                    'medications': list(dict.fromkeys(patient['medications']))
+                }
+
+
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, '*.ndjson'))))
+        else:
+            paths.append(item)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score patients from a FHIR Bulk Data NDJSON export')
+    parser.add_argument('--input', type=str, nargs='+', required=True, help='NDJSON files or export directories')
+    parser.add_argument('--output', type=str, default='fhir_scores.jsonl', help='Output JSONL, one line per patient')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Patients scored per batch')
+    parser.add_argument('--partitions', type=int, default=64, help='Hash partitions used for the join')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel parsers (-1 uses all cores)')
+    parser.add_argument('--reference-date', type=str, default=None, help='Date ages are computed at (YYYY-MM-DD, default today)')
+    parser.add_argument('--work-dir', type=str, default=None, help='Where temporary partition files go')
+    args = parser.parse_args()
+
+    reference_date = datetime.date.fromisoformat(args.reference_date) if args.reference_date else None
+    ingestor = FhirBulkIngestor(reference_date=reference_date, batch_size=args.batch_size,
+                                n_partitions=args.partitions, n_jobs=args.n_jobs, work_dir=args.work_dir)
+    risk_engine = PolygenicRiskEngine()
+    drug_analyzer = PharmacogenomicsAnalyzer()
+
+    with atomic_write(args.output) as out:
+        for batch in ingestor.batches(expand_inputs(args.input)):
+            risk_results = risk_engine.calculate_scores(batch)
+            drug_results = drug_analyzer.check_interactions_batch(batch)
+            for patient, risk, drugs in zip(batch, risk_results, drug_results):
+                out.write(json.dumps({
+                    'id': patient['id'],
+                    'age_group': patient['age_group'],
+                    'adjusted_risk': risk['adjusted_risk'],
+                    'risk_category': risk['risk_category'],
+                    'medication_effects': risk['medication_effects'],
+                    'warnings': drugs['warnings'],
+                    'recommendations': drugs['recommendations']
+                }) + '\n')
+
+    stats = ingestor.stats
+    print(f"Scored {stats['patients']} patients, results saved to {args.output}")
+    skipped = {k: v for k, v in stats.items() if k.startswith('skipped') or k == 'invalid_lines'}
+    if skipped:
+        print("Skipped: " + ', '.join(f"{k}={v}" for k, v in sorted(skipped.items())))
+
+if __name__ == '__main__':
+    main()
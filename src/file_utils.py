@@ -0,0 +1,98 @@
+# genix_alz/src/file_utils.py
+import contextlib
+import math
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=None, poll_interval=0.1):
+    """Hold an exclusive inter-process lock on `path` for the duration of the block.
+
+    The lock file is created if needed and deliberately left in place afterwards;
+    removing it would let a waiting process lock a file nobody else can see.
+    Raises TimeoutError if the lock is not acquired within `timeout` seconds.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with open(path, 'a+b') as f:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if deadline is None else fcntl.LOCK_NB))
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not acquire lock on {path} within {timeout}s")
+                time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """Write to a temporary file next to `path` and rename it into place on success.
+
+    Readers see either the previous file or the complete new one, never a
+    partially written file. On error the temporary file is removed.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file owner-only, give it the usual permissions of a written file
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def split_byte_ranges(path, chunk_bytes, start=0):
+    """Split a file from `start` to its end into (start, end) byte ranges of about chunk_bytes"""
+    size = os.path.getsize(path)
+    n_ranges = max(1, math.ceil((size - start) / chunk_bytes))
+    bounds = [start + (size - start) * i // n_ranges for i in range(n_ranges + 1)]
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def iter_lines_in_range(f, start, end):
+    """Yield the lines of binary file `f` that start inside [start, end).
+
+    Ranges from split_byte_ranges can then be read by independent workers and
+    every line is seen exactly once, whatever byte the boundaries fall on.
+    """
+    if start > 0:
+        # step back one byte so a range starting exactly at a line start keeps that line
+        f.seek(start - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    pos = f.tell()
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
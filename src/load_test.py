@@ -0,0 +1,300 @@
+# genix_alz/src/load_test.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from risk_calculator import PolygenicRiskEngine
+from drug_checker import PharmacogenomicsAnalyzer
+from server import assess_patient
+from synthetic_cohort import SyntheticCohortGenerator
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def read_rss_mb(pid):
+    """Current resident set size of a process in MB, or None if it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == os.getpid() and resource is not None:
+        # no /proc (e.g. macOS), fall back to the peak RSS of this process
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    return None
+
+
+class InProcessTarget:
+    """Runs the assessment path in this process, like the Streamlit app does"""
+
+    def __init__(self, reuse_engine=True, render_pdf=True):
+        self.reuse_engine = reuse_engine
+        self.render_pdf = render_pdf
+        self.pid = os.getpid()
+        # building the engines up front also makes sure the model exists before the clock starts
+        # evaluate=False: the random-data evaluation plots with global pyplot state and
+        # rewrites models/metrics, neither of which belongs in a measured request
+        self.risk_engine = PolygenicRiskEngine(evaluate=False)
+        self.drug_analyzer = PharmacogenomicsAnalyzer()
+
+    def __call__(self, patient):
+        if self.reuse_engine:
+            risk_engine, drug_analyzer = self.risk_engine, self.drug_analyzer
+        else:
+            risk_engine, drug_analyzer = PolygenicRiskEngine(evaluate=False), PharmacogenomicsAnalyzer()
+        assess_patient(patient, risk_engine, drug_analyzer, render_pdf=self.render_pdf)
+
+
+class HttpTarget:
+    """Posts patients to a running server (see src/server.py)"""
+
+    def __init__(self, base_url, render_pdf=True, timeout=60, pid=None):
+        self.url = base_url.rstrip('/') + '/assess' + ('' if render_pdf else '?report=0')
+        self.timeout = timeout
+        self.pid = pid
+
+    def __call__(self, patient):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(patient).encode(), headers={'Content-Type': 'application/json'}
+        )
+        # non-2xx responses raise HTTPError and are counted as errors
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class LoadTest:
+    def __init__(self, target, patients, users=10, rate=None, duration=30.0,
+                 max_requests=None, sample_interval=1.0, seed=42):
+        """Drive target with simulated users.
+
+        Without a rate every user sends its next request as soon as the previous
+        one finishes (closed loop). With a rate, requests arrive as a Poisson
+        process at that many per second and are served by at most `users` workers
+        (open loop); latency is then measured from the scheduled arrival, so
+        time spent queueing behind busy workers is included.
+        """
+        self.target = target
+        self.patients = patients
+        self.users = users
+        self.rate = rate
+        self.duration = duration
+        self.max_requests = max_requests
+        self.sample_interval = sample_interval
+        self.seed = seed
+
+        self._records = []
+        self._timeline = []
+        self._issued = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        self._start = time.perf_counter()
+        sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        sampler.start()
+
+        if self.rate:
+            self._run_open_loop()
+        else:
+            threads = [threading.Thread(target=self._closed_loop_user, args=(i,)) for i in range(self.users)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        elapsed = time.perf_counter() - self._start
+        self._done.set()
+        sampler.join()
+        return self._summarize(elapsed)
+
+    def _should_issue(self):
+        with self._lock:
+            if time.perf_counter() - self._start >= self.duration:
+                return False
+            if self.max_requests is not None and self._issued >= self.max_requests:
+                return False
+            self._issued += 1
+            return True
+
+    def _closed_loop_user(self, user_id):
+        rng = np.random.default_rng([self.seed, user_id])
+        while self._should_issue():
+            patient = self.patients[rng.integers(len(self.patients))]
+            self._execute(patient, time.perf_counter())
+
+    def _run_open_loop(self):
+        rng = np.random.default_rng(self.seed)
+        next_arrival = self._start
+        with ThreadPoolExecutor(max_workers=self.users) as pool:
+            while self._should_issue():
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                patient = self.patients[rng.integers(len(self.patients))]
+                pool.submit(self._execute, patient, next_arrival)
+                next_arrival += rng.exponential(1.0 / self.rate)
+
+    def _execute(self, patient, scheduled):
+        error = None
+        try:
+            self.target(patient)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finished = time.perf_counter()
+        self._records.append((finished - self._start, finished - scheduled, error))
+
+    def _sample_rss(self):
+        while True:
+            completed = len(self._records)
+            self._timeline.append({
+                't': round(time.perf_counter() - self._start, 2),
+                'rss_mb': read_rss_mb(self.target.pid) if self.target.pid else None,
+                'completed': completed,
+                'errors': sum(1 for r in self._records[:completed] if r[2] is not None)
+            })
+            if self._done.wait(self.sample_interval):
+                break
+
+    def _summarize(self, elapsed):
+        latencies = np.array([r[1] for r in self._records if r[2] is None]) * 1000
+        errors = [r[2] for r in self._records if r[2] is not None]
+        total = len(self._records)
+        rss = [s['rss_mb'] for s in self._timeline if s['rss_mb'] is not None]
+
+        summary = {
+            'users': self.users,
+            'rate': self.rate,
+            'elapsed_s': elapsed,
+            'requests': total,
+            'errors': len(errors),
+            'error_rate': len(errors) / total if total else 0.0,
+            'throughput_rps': total / elapsed if elapsed else 0.0,
+            'latency_ms': None,
+            'rss_mb': None,
+            'timeline': self._timeline,
+            'sample_errors': sorted(set(errors))[:5]
+        }
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary['latency_ms'] = {
+                'p50': p50, 'p95': p95, 'p99': p99,
+                'mean': latencies.mean(), 'max': latencies.max()
+            }
+        if rss:
+            summary['rss_mb'] = {'start': rss[0], 'end': rss[-1], 'peak': max(rss), 'growth': rss[-1] - rss[0]}
+        return summary
+
+
+def print_summary(summary):
+    mode = f"{summary['rate']:.1f} req/s arrivals" if summary['rate'] else "closed loop"
+    print(f"\nUsers: {summary['users']} ({mode}), duration {summary['elapsed_s']:.1f}s")
+    print(f"Requests: {summary['requests']}  Errors: {summary['errors']} ({summary['error_rate']*100:.2f}%)")
+    print(f"Throughput: {summary['throughput_rps']:.2f} req/s")
+
+    lat = summary['latency_ms']
+    if lat:
+        print(f"Latency (ms): p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  "
+              f"mean {lat['mean']:.1f}  max {lat['max']:.1f}")
+
+    rss = summary['rss_mb']
+    if rss:
+        print(f"RSS (MB): start {rss['start']:.1f}  end {rss['end']:.1f}  "
+              f"peak {rss['peak']:.1f}  growth {rss['growth']:+.1f}")
+        print("\n  time(s)   RSS(MB)  completed  errors")
+        for s in summary['timeline']:
+            rss_mb = f"{s['rss_mb']:.1f}" if s['rss_mb'] is not None else '-'
+            print(f"  {s['t']:>7.1f} {rss_mb:>9} {s['completed']:>10} {s['errors']:>7}")
+
+    for error in summary['sample_errors']:
+        print(f"  ⚠️ {error}")
+
+
+def load_patients(input_path, n_patients, seed):
+    if input_path is None:
+        generator = SyntheticCohortGenerator(seed=seed)
+        return generator.to_records(next(generator.batches(n_patients, batch_size=n_patients)))
+    with open(input_path) as f:
+        if input_path.endswith('.jsonl'):
+            return [json.loads(line) for line, _ in zip(f, range(n_patients))]
+        return [json.load(f)]
+
+
+def start_server(port, timeout=300):
+    """Start src/server.py in a child process and wait until it answers /health"""
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    process = subprocess.Popen([sys.executable, server_path, '--port', str(port)])
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Server did not become ready within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test of the genix_alz assessment path')
+    parser.add_argument('--target', type=str, default='in-process',
+                        help="'in-process' or the base URL of a running server, e.g. http://127.0.0.1:8000")
+    parser.add_argument('--serve', action='store_true', help='Start a local server and target it')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --serve')
+    parser.add_argument('--users', type=int, default=50, help='Concurrent simulated users')
+    parser.add_argument('--rate', type=float, default=None, help='Arrival rate in requests/s (default: closed loop)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--requests', type=int, default=None, help='Stop after this many requests')
+    parser.add_argument('--engine', type=str, choices=['reuse', 'construct'], default='reuse',
+                        help='In-process only: share one engine or build a new one per request')
+    parser.add_argument('--no-report', action='store_true', help='Skip PDF rendering')
+    parser.add_argument('--input', type=str, default=None, help='Patient .json or .jsonl (default: synthetic cohort)')
+    parser.add_argument('--patients', type=int, default=1000, help='Number of distinct patients to cycle through')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='Seconds between RSS samples')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--json-output', type=str, default=None, help='Also write the summary to this JSON file')
+    args = parser.parse_args()
+
+    patients = load_patients(args.input, args.patients, args.seed)
+    render_pdf = not args.no_report
+
+    server = None
+    try:
+        if args.serve:
+            server = start_server(args.port)
+            target = HttpTarget(f'http://127.0.0.1:{args.port}', render_pdf=render_pdf, pid=server.pid)
+        elif args.target == 'in-process':
+            target = InProcessTarget(reuse_engine=args.engine == 'reuse', render_pdf=render_pdf)
+        else:
+            target = HttpTarget(args.target, render_pdf=render_pdf)
+
+        summary = LoadTest(
+            target, patients, users=args.users, rate=args.rate, duration=args.duration,
+            max_requests=args.requests, sample_interval=args.sample_interval, seed=args.seed
+        ).run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_summary(summary)
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            json.dump(summary, f, indent=4, default=float)
+        print(f"\nSummary saved to {args.json_output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# genix_alz/src/medication_normalizer.py
+import json
+import re
+
+# Words and numbers; punctuation, hyphens and dose units like "mg/ml" split tokens apart
+_TOKEN_PATTERN = re.compile(r'[a-z]+|\d+(?:\.\d+)?')
+
+
+def _tokenize(name):
+    return _TOKEN_PATTERN.findall(name.lower())
+
+
+class MedicationNormalizer:
+    def __init__(self, synonyms_path='data/medication_synonyms.json', extra_names=(), max_cache_size=1_000_000):
+        """Map prescription strings to the medication names used in the drug rules.
+
+        Brand names, class members, case variants and dose/form suffixes
+        ("Coumadin 5 mg tablet", "ibuprofen 200MG", "ADVIL") resolve to their
+        canonical name ("Warfarin", "NSAIDs"). Names that match nothing are
+        returned unchanged apart from surrounding whitespace.
+        """
+        with open(synonyms_path) as f:
+            synonyms = json.load(f)
+
+        # phrase index keyed by the space-joined tokens of every name; together with
+        # max_words it acts as a token trie searched longest phrase first
+        self._index = {}
+        for canonical in list(synonyms) + list(extra_names):
+            self._add(canonical, canonical)
+        for canonical, names in synonyms.items():
+            for name in names:
+                self._add(name, canonical)
+        self.max_words = max((key.count(' ') + 1 for key in self._index), default=1)
+
+        self._cache = {}
+        self.max_cache_size = max_cache_size
+
+    def _add(self, name, canonical):
+        key = ' '.join(_tokenize(name))
+        if key:
+            self._index.setdefault(key, canonical)
+
+    def normalize(self, name):
+        """Canonical name of the first medication mentioned in `name`"""
+        return self.resolve(name)[0]
+
+    def resolve(self, name):
+        """Canonical names of every medication mentioned in `name`, in order and without duplicates.
+
+        Combination products such as "Advil PM (ibuprofen/diphenhydramine)" give
+        one name per ingredient class.
+        """
+        cached = self._cache.get(name)
+        if cached is not None:
+            return cached
+
+        canonical = tuple(dict.fromkeys(self._matches(_tokenize(name)))) or (name.strip(),)
+        if len(self._cache) >= self.max_cache_size:
+            self._cache.clear()
+        self._cache[name] = canonical
+        return canonical
+
+    def normalize_many(self, names):
+        """Normalize a list of names, deduplicated so repeated strings are resolved once"""
+        resolved = {name: self.normalize(name) for name in set(names)}
+        return [resolved[name] for name in names]
+
+    def normalize_medications(self, medications):
+        """Canonical medication list for one patient, without duplicates and in original order"""
+        resolved = {name: self.resolve(name) for name in set(medications)}
+        return list(dict.fromkeys(canonical for name in medications for canonical in resolved[name]))
+
+    def _matches(self, tokens):
+        # scan left to right taking the longest phrase at each position, then continue
+        # after it, so matches never overlap: "Warfarin sodium 5mg" and "Tab warfarin"
+        # give Warfarin once, "Advil PM (ibuprofen/diphenhydramine)" NSAIDs and Anticholinergics
+        start = 0
+        while start < len(tokens):
+            step = 1
+            if not tokens[start][0].isdigit():
+                for length in range(min(self.max_words, len(tokens) - start), 0, -1):
+                    canonical = self._index.get(' '.join(tokens[start:start + length]))
+                    if canonical is not None:
+                        yield canonical
+                        step = length
+                        break
+            start += step
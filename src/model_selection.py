@@ -0,0 +1,304 @@
+# genix_alz/src/model_selection.py
+import argparse
+import hashlib
+import json
+import math
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import joblib
+from joblib import Parallel, delayed
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, HistGradientBoostingClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from file_utils import atomic_write
+from risk_calculator import ALZ_GENES
+from synthetic_cohort import SyntheticCohortGenerator
+
+# Candidate tree ensembles and the hyperparameters searched for each
+MODEL_SPACES = {
+    'random_forest': (RandomForestClassifier, {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [None, 8, 16],
+        'min_samples_leaf': [1, 5]
+    }),
+    'extra_trees': (ExtraTreesClassifier, {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [None, 8, 16],
+        'min_samples_leaf': [1, 5]
+    }),
+    'hist_gradient_boosting': (HistGradientBoostingClassifier, {
+        'max_iter': [100, 300],
+        'learning_rate': [0.05, 0.1],
+        'max_depth': [None, 6],
+        'early_stopping': [True]
+    })
+}
+CALIBRATION_METHODS = ['sigmoid', 'isotonic']
+
+
+def build_candidates(model_names):
+    candidates = []
+    for name in model_names:
+        _, grid = MODEL_SPACES[name]
+        for params in ParameterGrid(grid):
+            for method in CALIBRATION_METHODS:
+                candidates.append({'model': name, 'params': params, 'calibration': method})
+    return candidates
+
+
+def make_estimator(candidate, seed=42):
+    estimator_class, _ = MODEL_SPACES[candidate['model']]
+    estimator = estimator_class(random_state=seed, **candidate['params'])
+    if 'n_jobs' in estimator.get_params():
+        # the search is already parallel across candidates
+        estimator.set_params(n_jobs=1)
+    return CalibratedClassifierCV(estimator, method=candidate['calibration'], cv=3)
+
+
+def encode_cohort_csv(path):
+    """Effect-size feature matrix and labels from a CSV with one column per gene and a 'diagnosis' column"""
+    df = pd.read_csv(path)
+    X = np.column_stack([
+        df[gene].map(ALZ_GENES[gene]).fillna(0.0).to_numpy() if gene in df else np.zeros(len(df))
+        for gene in ALZ_GENES
+    ])
+    return X.astype(np.float32), df['diagnosis'].to_numpy().astype(np.uint8)
+
+
+def encode_synthetic_cohort(n_patients, seed):
+    generator = SyntheticCohortGenerator(seed=seed)
+    effects = [np.array(list(ALZ_GENES[gene].values()), dtype=np.float32) for gene in generator.genes]
+    X_parts, y_parts = [], []
+    for batch in generator.batches(n_patients):
+        X_parts.append(np.column_stack([effects[j][batch['genotype'][:, j]] for j in range(len(effects))]))
+        y_parts.append(generator.simulate_diagnosis(batch))
+    return np.vstack(X_parts), np.concatenate(y_parts)
+
+
+class FeatureCache:
+    """Encoded feature matrices and CV splits cached on disk, keyed by data source and settings.
+
+    X is reopened as a read-only memmap so parallel workers share one copy
+    instead of each receiving a pickled array.
+    """
+
+    def __init__(self, cache_dir='models/cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, input_path=None, n_patients=20000, folds=3, seed=42):
+        if input_path:
+            stat = os.stat(input_path)
+            source = {'input': os.path.abspath(input_path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+        else:
+            source = {'synthetic': n_patients, 'seed': seed}
+        key = self._key(source)
+        X_path = os.path.join(self.cache_dir, f'features_{key}.npy')
+        y_path = os.path.join(self.cache_dir, f'labels_{key}.npy')
+
+        if not (os.path.exists(X_path) and os.path.exists(y_path)):
+            X, y = encode_cohort_csv(input_path) if input_path else encode_synthetic_cohort(n_patients, seed)
+            with atomic_write(X_path, 'wb') as f:
+                np.save(f, X)
+            with atomic_write(y_path, 'wb') as f:
+                np.save(f, y)
+        X = np.load(X_path, mmap_mode='r')
+        y = np.load(y_path)
+
+        splits_path = os.path.join(self.cache_dir, f'splits_{self._key({**source, "folds": folds})}.pkl')
+        if os.path.exists(splits_path):
+            splits = joblib.load(splits_path)
+        else:
+            splits = self._make_splits(y, folds, seed)
+            with atomic_write(splits_path, 'wb') as f:
+                joblib.dump(splits, f)
+        return X, y, splits
+
+    def _make_splits(self, y, folds, seed):
+        # training indices are shuffled once, so successive halving can take a prefix as a subsample
+        rng = np.random.default_rng(seed)
+        cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+        return [(rng.permutation(train), val) for train, val in cv.split(np.zeros(len(y)), y)]
+
+    def _key(self, source):
+        return hashlib.sha1(json.dumps(source, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def fit_and_score(candidate, X, y, train_idx, val_idx, n_samples, seed=42):
+    """Fit one candidate on the first n_samples of a fold and measure quality, fit time and size"""
+    model, fit_time = fit_candidate(candidate, X, y, train_idx, n_samples, seed)
+    proba = model.predict_proba(np.asarray(X[val_idx]))[:, 1]
+    return {
+        'auc': roc_auc_score(y[val_idx], proba),
+        'fit_time_s': fit_time,
+        'model_size_kb': len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024
+    }
+
+
+def fit_candidate(candidate, X, y, train_idx, n_samples, seed=42):
+    train_idx = np.sort(train_idx[:n_samples])
+    model = make_estimator(candidate, seed)
+    start = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx])
+    return model, time.perf_counter() - start
+
+
+def time_inference(model, X_val, n_single=50, repeats=5):
+    """Single-patient latency and batch cost per patient of a fitted model.
+
+    Meant to run serially in the main process once the parallel search is over,
+    so timings are not skewed by other workers competing for the same cores.
+    Both are measured after a warm-up call; the batch time is the best of
+    `repeats` runs and the latency the median of n_single one-row calls.
+    """
+    X_val = np.ascontiguousarray(X_val)
+    model.predict_proba(X_val[:1])
+    model.predict_proba(X_val)
+
+    batch_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(X_val)
+        batch_times.append(time.perf_counter() - start)
+
+    # single-patient latency is what calculate_score pays per request
+    single_times = []
+    for i in range(n_single):
+        row = X_val[i % len(X_val):i % len(X_val) + 1]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single_times.append(time.perf_counter() - start)
+
+    return {
+        'latency_ms': float(np.median(single_times)) * 1000,
+        'batch_us_per_patient': min(batch_times) / len(X_val) * 1e6
+    }
+
+
+def time_finalists(results, X, y, splits, n_jobs=-1, seed=42):
+    """Add inference timings to the given results, refitting them on the first fold.
+
+    Refits run in parallel, the timings themselves one model at a time.
+    """
+    train, val = splits[0]
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(fit_candidate)(result, X, y, train, result['n_samples'], seed) for result in results
+    )
+    X_val = np.asarray(X[val])
+    for result, (model, _) in zip(results, fitted):
+        result.update(time_inference(model, X_val))
+    return results
+
+
+def successive_halving(candidates, X, y, splits, factor=3, min_resources=1000, n_jobs=-1, seed=42, verbose=True):
+    """Evaluate candidates on growing training subsets, keeping the best 1/factor each round.
+
+    Resources start so that the last round trains on the full folds. With
+    factor=1 every candidate is evaluated once on all the data.
+    """
+    n_train = min(len(train) for train, _ in splits)
+    if factor > 1:
+        n_rounds = math.ceil(math.log(len(candidates), factor)) + 1
+        resources = max(min_resources, n_train // factor ** (n_rounds - 1))
+    else:
+        n_rounds, resources = 1, n_train
+
+    survivors = list(range(len(candidates)))
+    history = []
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for round_idx in range(n_rounds):
+            n_samples = n_train if round_idx == n_rounds - 1 else min(n_train, resources * factor ** round_idx)
+            fold_scores = parallel(
+                delayed(fit_and_score)(candidates[c], X, y, train, val, n_samples, seed)
+                for c in survivors for train, val in splits
+            )
+
+            round_results = []
+            for k, c in enumerate(survivors):
+                scores = fold_scores[k * len(splits):(k + 1) * len(splits)]
+                result = {
+                    'round': round_idx,
+                    'n_samples': n_samples,
+                    **candidates[c],
+                    'auc_std': float(np.std([s['auc'] for s in scores]))
+                }
+                for metric in scores[0]:
+                    result[metric] = float(np.mean([s[metric] for s in scores]))
+                round_results.append((c, result))
+            history.extend(r for _, r in round_results)
+
+            if verbose:
+                best = max(r['auc'] for _, r in round_results)
+                print(f"Round {round_idx}: {len(survivors)} candidates on {n_samples} samples, best AUC {best:.4f}")
+
+            if n_samples >= n_train or len(survivors) == 1:
+                break
+            round_results.sort(key=lambda cr: cr[1]['auc'], reverse=True)
+            keep = max(1, math.ceil(len(survivors) / factor))
+            survivors = [c for c, _ in round_results[:keep]]
+
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hyperparameter search and model selection for the risk model')
+    parser.add_argument('--input', type=str, default=None, help="Cohort CSV with gene columns and 'diagnosis' (default: synthetic)")
+    parser.add_argument('--n', type=int, default=20000, help='Synthetic cohort size when no --input is given')
+    parser.add_argument('--models', type=str, default=','.join(MODEL_SPACES), help='Comma-separated model families')
+    parser.add_argument('--folds', type=int, default=3, help='Cross-validation folds')
+    parser.add_argument('--factor', type=int, default=3, help='Successive halving factor (1 disables halving)')
+    parser.add_argument('--min-resources', type=int, default=1000, help='Training samples in the first halving round')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel workers (-1 uses all cores)')
+    parser.add_argument('--time-top', type=int, default=5, help='Candidates whose inference speed is timed after the search')
+    parser.add_argument('--cache-dir', type=str, default='models/cache', help='Where encoded features and splits are cached')
+    parser.add_argument('--output', type=str, default='models/metrics/model_selection.json', help='Results file')
+    parser.add_argument('--save-best', action='store_true', help='Refit the best candidate on all data and save it as models/risk_model.pkl')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    args = parser.parse_args()
+    if args.time_top < 0:
+        parser.error('--time-top must be 0 or more')
+
+    X, y, splits = FeatureCache(args.cache_dir).load(args.input, args.n, args.folds, args.seed)
+    candidates = build_candidates(args.models.split(','))
+    print(f"Searching {len(candidates)} candidates on {len(y)} patients ({args.folds}-fold CV)...")
+
+    start = time.perf_counter()
+    history = successive_halving(
+        candidates, X, y, splits, factor=args.factor, min_resources=args.min_resources,
+        n_jobs=args.n_jobs, seed=args.seed
+    )
+    print(f"Search finished in {time.perf_counter() - start:.1f}s")
+
+    # rank every candidate by the largest training size it reached, then by AUC
+    final = {}
+    for result in history:
+        final[json.dumps([result['model'], result['params'], result['calibration']], sort_keys=True)] = result
+    ranking = sorted(final.values(), key=lambda r: (r['n_samples'], r['auc']), reverse=True)
+    if args.time_top > 0:
+        print(f"Timing inference of the top {min(args.time_top, len(ranking))} candidates...")
+        time_finalists(ranking[:args.time_top], X, y, splits, n_jobs=args.n_jobs, seed=args.seed)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'ranking': ranking, 'history': history}, f, indent=4)
+    pd.DataFrame(ranking).to_csv(os.path.splitext(args.output)[0] + '.csv', index=False)
+    print(f"Model selection results saved to {args.output}")
+
+    columns = ['model', 'calibration', 'params', 'n_samples', 'auc', 'fit_time_s', 'latency_ms', 'model_size_kb']
+    # untimed candidates have no latency_ms, and with --time-top 0 no row has it
+    print(pd.DataFrame(ranking[:10]).reindex(columns=columns).to_string(index=False))
+
+    if args.save_best:
+        best = ranking[0]
+        model = make_estimator(best, args.seed)
+        model.fit(pd.DataFrame(np.asarray(X), columns=list(ALZ_GENES.keys())), y)
+        with atomic_write('models/risk_model.pkl', 'wb') as f:
+            joblib.dump(model, f)
+        print(f"Best model ({best['model']}, {best['calibration']}) saved to models/risk_model.pkl")
+
+if __name__ == '__main__':
+    main()
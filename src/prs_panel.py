@@ -0,0 +1,194 @@
+# genix_alz/src/prs_panel.py
+import argparse
+import io
+import os
+from itertools import islice
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from joblib import Parallel, delayed, effective_n_jobs
+from file_utils import iter_lines_in_range, split_byte_ranges
+
+# Column names used by common weight file formats (PGS Catalog, PLINK --score, ...)
+WEIGHT_COLUMN_ALIASES = {
+    'variant_id': 'variant_id', 'rsid': 'variant_id', 'snp': 'variant_id', 'id': 'variant_id',
+    'effect_allele': 'effect_allele', 'a1': 'effect_allele',
+    'weight': 'weight', 'effect_weight': 'weight', 'beta': 'weight',
+    'allelefrequency_effect': 'effect_allele_frequency', 'effect_allele_frequency': 'effect_allele_frequency',
+    'eaf': 'effect_allele_frequency'
+}
+
+# Leading columns of a PLINK --recode A (.raw) dosage file
+PLINK_RAW_FIXED_COLUMNS = ['FID', 'IID', 'PAT', 'MAT', 'SEX', 'PHENOTYPE']
+
+
+class WeightPanel:
+    def __init__(self, weights_path):
+        """Load a polygenic score weight file with variant ID, effect allele and weight columns.
+
+        Tab-separated (.tsv/.txt) or comma-separated files are accepted, optionally
+        gzipped; '#' comment lines such as the PGS Catalog header are skipped. An
+        optional effect allele frequency column is used to impute variants with
+        no observed dosage.
+        """
+        sep = '\t' if any(ext in weights_path for ext in ('.tsv', '.txt')) else ','
+        df = pd.read_csv(weights_path, sep=sep, comment='#')
+        df = df.rename(columns={c: WEIGHT_COLUMN_ALIASES[c.lower()] for c in df.columns
+                                if c.lower() in WEIGHT_COLUMN_ALIASES})
+        missing = {'variant_id', 'effect_allele', 'weight'} - set(df.columns)
+        if missing:
+            raise ValueError(f"Weight file {weights_path} is missing columns: {', '.join(sorted(missing))}")
+
+        df = df.drop_duplicates('variant_id')
+        self.variant_ids = df['variant_id'].astype(str).to_numpy()
+        self.effect_alleles = df['effect_allele'].astype(str).str.upper().to_numpy()
+        self.weights = df['weight'].to_numpy(dtype=np.float64)
+        self.frequencies = (df['effect_allele_frequency'].to_numpy(dtype=np.float64)
+                            if 'effect_allele_frequency' in df else np.full(len(df), np.nan))
+        self._index = {v: i for i, v in enumerate(self.variant_ids)}
+
+    def __len__(self):
+        return len(self.variant_ids)
+
+    def align(self, columns):
+        """Match dosage columns, given as (variant_id, counted_allele) pairs, against the panel.
+
+        Returns a sparse (n_columns x 1) weight vector and a constant offset. When a
+        column counts the other allele the weight is negated and 2*weight added to
+        the offset, since effect dosage = 2 - counted dosage for a biallelic site.
+        """
+        rows, values, offset = [], [], 0.0
+        for col, (variant_id, allele) in enumerate(columns):
+            i = self._index.get(variant_id)
+            if i is None:
+                continue
+            if allele.upper() == self.effect_alleles[i]:
+                values.append(self.weights[i])
+            else:
+                values.append(-self.weights[i])
+                offset += 2 * self.weights[i]
+            rows.append(col)
+        weights = sp.csr_matrix((values, (rows, np.zeros(len(rows), dtype=int))), shape=(len(columns), 1))
+        return weights, offset
+
+    def score(self, dosages, columns):
+        """Polygenic score of every sample in a dense or scipy.sparse dosage matrix"""
+        weights, offset = self.align(columns)
+        if sp.issparse(dosages):
+            # keep the product sparse-sparse, most dosage entries of rare effect alleles are zero
+            return (sp.csr_matrix(dosages) @ weights).toarray().ravel() + offset
+        return np.asarray(dosages, dtype=np.float64) @ weights.toarray().ravel() + offset
+
+    def score_plink_raw(self, path, chunksize=10000, n_jobs=-1, standardize=False):
+        """Score a PLINK .raw dosage file in parallel, bounded-memory chunks.
+
+        The file is split into byte ranges, one per task, and every worker parses only
+        its own range `chunksize` lines at a time, keeping only the panel columns.
+        A first pass sums the observed dosages of every variant over the whole file,
+        so missing dosages are imputed with cohort-wide means and scores do not
+        depend on chunksize or n_jobs. Variants never observed fall back to twice
+        the weight file's allele frequency, or else contribute nothing. Returns a
+        DataFrame with IID and PRS in file order.
+        """
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+        header = header_line.decode().split()
+        columns = [tuple(c.rsplit('_', 1)) for c in header[len(PLINK_RAW_FIXED_COLUMNS):]]
+        matched = [k for k, (variant_id, _) in enumerate(columns) if variant_id in self._index]
+        if not matched:
+            raise ValueError(f"No variants in {path} match the weight panel")
+
+        weights, offset = self.align([columns[k] for k in matched])
+        weights = weights.toarray().ravel()
+        usecols = [1] + [len(PLINK_RAW_FIXED_COLUMNS) + k for k in matched]
+
+        n_jobs = effective_n_jobs(n_jobs)
+        body_start = len(header_line)
+        chunk_bytes = max(1, (os.path.getsize(path) - body_start) // (n_jobs * 4))
+        ranges = split_byte_ranges(path, chunk_bytes, start=body_start)
+        with Parallel(n_jobs=n_jobs) as parallel:
+            stats = parallel(
+                delayed(_dosage_sums_byte_range)(path, start, end, usecols, chunksize) for start, end in ranges
+            )
+            sums = np.sum([s for s, _ in stats], axis=0)
+            counts = np.sum([c for _, c in stats], axis=0)
+            means = self._fallback_means([columns[k] for k in matched])
+            np.divide(sums, counts, out=means, where=counts > 0)
+
+            parts = parallel(
+                delayed(_score_byte_range)(path, start, end, usecols, weights, offset, means, chunksize)
+                for start, end in ranges
+            )
+        result = pd.concat(parts, ignore_index=True)
+        if standardize:
+            result['PRS'] = (result['PRS'] - result['PRS'].mean()) / result['PRS'].std()
+        return result
+
+    def _fallback_means(self, columns):
+        # counted-allele dosage for variants with no observed value: from the weight
+        # file frequency when there is one, otherwise an effect dosage of 0
+        means = np.empty(len(columns))
+        for col, (variant_id, allele) in enumerate(columns):
+            i = self._index[variant_id]
+            flipped = allele.upper() != self.effect_alleles[i]
+            frequency = self.frequencies[i]
+            effect_dosage = 0.0 if np.isnan(frequency) else 2 * frequency
+            means[col] = 2 - effect_dosage if flipped else effect_dosage
+        return means
+
+
+def _iter_chunks(path, start, end, usecols, chunksize):
+    """Parse the lines that start inside [start, end) of a PLINK .raw file, chunksize lines at a time"""
+    with open(path, 'rb') as f:
+        lines = iter_lines_in_range(f, start, end)
+        while True:
+            lines_chunk = list(islice(lines, chunksize))
+            if not lines_chunk:
+                break
+            chunk = pd.read_csv(io.BytesIO(b''.join(lines_chunk)), sep=r'\s+', header=None, usecols=usecols,
+                                na_values=['NA'], dtype={1: str})
+            yield chunk[1].to_numpy(), chunk[usecols[1:]].to_numpy(dtype=np.float64)
+
+
+def _dosage_sums_byte_range(path, start, end, usecols, chunksize):
+    """Per-variant sum and count of the observed dosages in one byte range"""
+    sums = np.zeros(len(usecols) - 1)
+    counts = np.zeros(len(usecols) - 1, dtype=np.int64)
+    for _, dosages in _iter_chunks(path, start, end, usecols, chunksize):
+        observed = ~np.isnan(dosages)
+        sums += np.where(observed, dosages, 0.0).sum(axis=0)
+        counts += observed.sum(axis=0)
+    return sums, counts
+
+
+def _score_byte_range(path, start, end, usecols, weights, offset, means, chunksize):
+    """Score every line that starts inside [start, end) of a PLINK .raw file"""
+    parts = []
+    for iids, dosages in _iter_chunks(path, start, end, usecols, chunksize):
+        missing = np.isnan(dosages)
+        if missing.any():
+            dosages[missing] = means[np.nonzero(missing)[1]]
+        parts.append(pd.DataFrame({'IID': iids, 'PRS': dosages @ weights + offset}))
+    if not parts:
+        return pd.DataFrame({'IID': pd.Series(dtype=str), 'PRS': pd.Series(dtype=float)})
+    return pd.concat(parts, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute polygenic scores from a weight file and PLINK dosages')
+    parser.add_argument('--weights', type=str, required=True, help='Weight file (variant ID, effect allele, weight)')
+    parser.add_argument('--dosages', type=str, required=True, help='PLINK --recode A .raw dosage file')
+    parser.add_argument('--output', type=str, default='prs.csv', help='Output CSV with IID and PRS')
+    parser.add_argument('--chunksize', type=int, default=10000, help='Samples parsed per chunk')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel workers (-1 uses all cores)')
+    parser.add_argument('--standardize', action='store_true', help='Z-score the PRS within the cohort')
+    args = parser.parse_args()
+
+    panel = WeightPanel(args.weights)
+    scores = panel.score_plink_raw(args.dosages, chunksize=args.chunksize, n_jobs=args.n_jobs,
+                                   standardize=args.standardize)
+    scores.to_csv(args.output, index=False)
+    print(f"Scored {len(scores)} samples with {len(panel)} weighted variants, saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
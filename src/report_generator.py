@@ -2,6 +2,7 @@
 from fpdf import FPDF
 import base64
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from tempfile import NamedTemporaryFile
 import numpy as np
 import io
@@ -32,13 +33,15 @@ class ClinicalReportGenerator:
         pdf.cell(0, 10, 'Genetic Risk Assessment', 0, 1)
         pdf.set_font('Arial', '', 12)
         pdf.cell(0, 10, f"Lifetime AD Risk: {self.risk['adjusted_risk']:.1f}%", 0, 1)
+        if 'adjusted_risk_interval' in self.risk:
+            low, high = self.risk['adjusted_risk_interval']
+            pdf.cell(0, 10, f"{self.risk['confidence']*100:.0f}% Interval: {low:.1f}% - {high:.1f}%", 0, 1)
         pdf.cell(0, 10, f"Risk Category: {self.risk['risk_category']}", 0, 1)
         
         # risk visualization
-        self._generate_risk_chart()
+        fig = self._generate_risk_chart()
         with NamedTemporaryFile(suffix=".png") as tmpfile:
-            plt.savefig(tmpfile.name)
-            plt.close()
+            fig.savefig(tmpfile.name)
             pdf.image(tmpfile.name, x=50, w=110)
         
         pdf.ln(5)
@@ -81,7 +84,9 @@ class ClinicalReportGenerator:
         return output_path
     
     def _generate_risk_chart(self):
-        plt.figure(figsize=(8, 4))
+        # a standalone Figure instead of pyplot's global state, so reports can be rendered from several threads
+        fig = Figure(figsize=(8, 4))
+        ax = fig.add_subplot()
         groups = ['Low', 'Moderate', 'High', 'Very High']
         values = [10, 25, 40, 95]
         colors = ['green', 'yellow', 'orange', 'red']
@@ -92,12 +97,13 @@ class ClinicalReportGenerator:
             # Handle the case where current_risk is higher than all values
             bar_idx = len(values) - 1  # or any default safe index
         
-        plt.bar(groups, values, color=colors, alpha=0.3)
-        plt.bar(groups[bar_idx], current_risk, color=colors[bar_idx])
-        plt.axhline(y=current_risk, color='gray', linestyle='--')
-        plt.ylabel('Risk (%)')
-        plt.title('Alzheimer\'s Lifetime Risk')
-        plt.tight_layout()
+        ax.bar(groups, values, color=colors, alpha=0.3)
+        ax.bar(groups[bar_idx], current_risk, color=colors[bar_idx])
+        ax.axhline(y=current_risk, color='gray', linestyle='--')
+        ax.set_ylabel('Risk (%)')
+        ax.set_title('Alzheimer\'s Lifetime Risk')
+        fig.tight_layout()
+        return fig
     
     def _plot_to_base64(self):
         buf = io.BytesIO()
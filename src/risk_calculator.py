@@ -10,6 +10,9 @@ from sklearn.model_selection import train_test_split
 import joblib
 import json
 import os
+from file_utils import atomic_write, file_lock
+from medication_normalizer import MedicationNormalizer
+from prs_panel import WeightPanel
 
 # Alzheimer's risk genes with effect sizes (based on ADSP/IGAP meta-analyses)
 ALZ_GENES = {
@@ -31,30 +34,60 @@ ALZ_GENES = {
 
 class PolygenicRiskEngine:
     def __init__(self, model_path='models/risk_model.pkl', 
-                 drug_rules_path='data/drug_interactions.json'):
+                 drug_rules_path='data/drug_interactions.json',
+                 weights_path=None, prs_mode=None,
+                 synonyms_path='data/medication_synonyms.json', evaluate=True):
+        # with a prs_mode the model also sees a 'PRS' feature, next to or instead of the 11 genes;
+        # scoring then takes each patient's precomputed 'prs', the weight file is only needed
+        # (and only loaded) by polygenic_scores
+        if prs_mode is None and weights_path:
+            prs_mode = 'append'
+        if prs_mode not in (None, 'append', 'replace'):
+            raise ValueError(f"prs_mode must be 'append' or 'replace', got '{prs_mode}'")
+        self.weights_path = weights_path
+        self.prs_mode = prs_mode
+        self._weight_panel = None
+        self.feature_names = list(ALZ_GENES.keys())
+        if prs_mode is not None:
+            self.feature_names = ['PRS'] if prs_mode == 'replace' else self.feature_names + ['PRS']
+
         #self.model = joblib.load(model_path) if os.path.exists(model_path) else self._train_model()
-        if os.path.exists(model_path):
+        self.model = None
+        if not os.path.exists(model_path):
+            # exactly one process trains a missing model, the others wait here and load the finished file
+            with file_lock(model_path + '.lock'):
+                if not os.path.exists(model_path):
+                    self.model = self._train_model(model_path)
+        if self.model is None:
             self.model = joblib.load(model_path)
-            X_test = np.random.rand(300, len(ALZ_GENES))
-            y_test = np.random.randint(0, 2, 300)
-            self.evaluate_model(X_test, y_test)
-        else:
-            self.model = self._train_model()
+            n_features = getattr(self.model, 'n_features_in_', len(self.feature_names))
+            if n_features != len(self.feature_names):
+                raise ValueError(
+                    f"{model_path} expects {n_features} features but this engine uses {len(self.feature_names)} "
+                    f"({', '.join(self.feature_names)}); pass a model_path for a matching model"
+                )
+            if evaluate:
+                X_test = np.random.rand(300, len(self.feature_names))
+                y_test = np.random.randint(0, 2, 300)
+                self.evaluate_model(X_test, y_test)
         self.drug_rules = self._load_drug_rules(drug_rules_path)
+        rule_names = {med for rules in self.drug_rules.values() for med in rules if med != 'alternatives'}
+        self.normalizer = MedicationNormalizer(synonyms_path, extra_names=sorted(rule_names))
         self.base_risk = {'50-59': 1.2, '60-69': 3.4, '70-79': 7.1, '80+': 16.3}
+        self._interval_members = None
         
     def _load_drug_rules(self, path):
         with open(path) as f:
             return json.load(f)
     
-    def _train_model(self):
+    def _train_model(self, model_path='models/risk_model.pkl'):
         """Train model on synthetic data if no pre-trained exists"""
         print("Training risk model on synthetic cohort...")
         model = RandomForestClassifier(n_estimators=100, random_state=42)
         calibrated = CalibratedClassifierCV(model, cv=3)
-        feature_names = list(ALZ_GENES.keys())
+        feature_names = self.feature_names
         # In production: Replace with real ADNI/UKB data
-        X = np.random.rand(1000, len(ALZ_GENES))
+        X = np.random.rand(1000, len(feature_names))
         X_df = pd.DataFrame(X, columns=feature_names)
         y = np.random.randint(0, 2, 1000)
         X_train, X_test, y_train, y_test = train_test_split(X_df, y, test_size=0.3, random_state=42)
@@ -63,8 +96,9 @@ class PolygenicRiskEngine:
         self.model = calibrated
         self.evaluate_model(X_test, y_test)
 
-        os.makedirs('models', exist_ok=True)
-        joblib.dump(calibrated, 'models/risk_model.pkl')
+        # written to a temp file and renamed, so nobody can load a half-written pickle
+        with atomic_write(model_path, 'wb') as f:
+            joblib.dump(calibrated, f)
         
         return calibrated
 
@@ -102,7 +136,8 @@ class PolygenicRiskEngine:
         plt.ylabel('True Positive Rate')
         plt.title('Receiver Operating Characteristic (ROC) Curve')
         plt.legend(loc='lower right')
-        plt.savefig(os.path.join(metrics_path, 'roc_curve.png'))
+        with atomic_write(os.path.join(metrics_path, 'roc_curve.png'), 'wb') as f:
+            plt.savefig(f, format='png')
         plt.close()
         
         plt.figure(figsize=(6, 5))
@@ -110,7 +145,8 @@ class PolygenicRiskEngine:
         plt.title('Confusion Matrix')
         plt.xlabel('Predicted Label')
         plt.ylabel('True Label')
-        plt.savefig(os.path.join(metrics_path, 'confusion_matrix.png'))
+        with atomic_write(os.path.join(metrics_path, 'confusion_matrix.png'), 'wb') as f:
+            plt.savefig(f, format='png')
         plt.close()
 
         return results
@@ -122,45 +158,183 @@ class PolygenicRiskEngine:
         metrics_path = os.path.join("models", "metrics", file_name)
         results_to_save = {k: results[k] for k in filter_keys} if filter_keys else results
 
-        with open(metrics_path, 'w') as json_file:
+        with atomic_write(metrics_path) as json_file:
             json.dump(results_to_save, json_file, indent=4)
 
         if "classification_report" in results:
             class_report_df = pd.DataFrame(results["classification_report"]).transpose()
             csv_path = metrics_path.replace(".json", "_classification_report.csv")
-            class_report_df.to_csv(csv_path)
+            with atomic_write(csv_path) as csv_file:
+                class_report_df.to_csv(csv_file)
             print(f"Classification report saved to {csv_path}")
 
         print(f"Evaluation results saved to {metrics_path}")
 
-    def calculate_score(self, genotype, age_group, medications=[]):
+    def calculate_score(self, genotype, age_group, medications=[], return_interval=False, confidence=0.9, prs=None):
         """Calculate lifetime AD risk with drug interactions"""
-        # converting genotype to feature vector
-        X = pd.DataFrame([{
-            gene: ALZ_GENES[gene].get(genotype.get(gene, ''), 0.0)
-            for gene in ALZ_GENES
-        }], columns=list(ALZ_GENES.keys()))
-        
-        # here we calculate risk
-        proba = self.model.predict_proba(X)[0][1]
-        adjusted_risk = min(95, proba * 100 * self.base_risk[age_group])
-        
-        # we should apply medication adjustments
+        patient = {'genotype': genotype, 'age_group': age_group, 'medications': medications, 'prs': prs}
+        return self.calculate_scores([patient], return_interval=return_interval, confidence=confidence)[0]
+
+    def calculate_scores(self, patients, return_interval=False, confidence=0.9):
+        """Score a whole cohort in one pass.
+
+        Each patient is a dict with 'genotype', 'age_group' and optionally
+        'medications'; engines built with a weight file also need 'prs'.
+        With return_interval=True every result also carries a (lower, upper)
+        confidence interval on raw_score and adjusted_risk, from a bootstrap
+        over the trees of the forest (see _interval_bounds).
+        """
+        if return_interval and not 0 < confidence < 1:
+            raise ValueError(f"confidence must be between 0 and 1, got {confidence}")
+        if not patients:
+            return []
+
+        # converting genotypes to a feature matrix
+        X = self._encode_features(patients)
+
+        # here we calculate risk for everyone at once
+        proba = self.model.predict_proba(X)[:, 1]
+        base = np.array([self.base_risk[p['age_group']] for p in patients])
+
+        # we should apply medication adjustments, after mapping brand names and dose suffixes onto the rule names
+        multipliers = np.ones(len(patients))
+        all_modifiers = []
+        for i, p in enumerate(patients):
+            medications = self.normalizer.normalize_medications(p.get('medications', []))
+            multipliers[i], modifiers = self._medication_adjustment(p['genotype'], medications)
+            all_modifiers.append(modifiers)
+
+        adjusted = np.minimum(95, proba * 100 * base) * multipliers
+
+        if return_interval:
+            raw_lo, raw_hi = self._interval_bounds(X, confidence)
+            # the bounds are bootstrap quantiles, make sure they always contain the point estimate
+            raw_lo, raw_hi = np.minimum(raw_lo, proba), np.maximum(raw_hi, proba)
+            adj_lo = np.minimum(95, raw_lo * 100 * base) * multipliers
+            adj_hi = np.minimum(95, raw_hi * 100 * base) * multipliers
+
+        results = []
+        for i in range(len(patients)):
+            result = {
+                'raw_score': proba[i],
+                'adjusted_risk': adjusted[i],
+                'risk_category': self._categorize_risk(adjusted[i]),
+                'medication_effects': all_modifiers[i]
+            }
+            if return_interval:
+                result['confidence'] = confidence
+                result['raw_score_interval'] = (raw_lo[i], raw_hi[i])
+                result['adjusted_risk_interval'] = (adj_lo[i], adj_hi[i])
+            results.append(result)
+        return results
+
+    def polygenic_scores(self, dosages_path, chunksize=10000, n_jobs=-1, standardize=False):
+        """PRS for every sample of a PLINK .raw dosage file, to pass as 'prs' when scoring"""
+        if self.weights_path is None:
+            raise ValueError("No weight file was given to this engine")
+        if self._weight_panel is None:
+            self._weight_panel = WeightPanel(self.weights_path)
+        return self._weight_panel.score_plink_raw(dosages_path, chunksize=chunksize, n_jobs=n_jobs,
+                                                 standardize=standardize)
+
+    def _encode_features(self, patients):
+        X = self._encode_genotypes([p['genotype'] for p in patients])
+        if self.prs_mode is None:
+            return X
+        if any(p.get('prs') is None for p in patients):
+            raise ValueError("Every patient needs a precomputed polygenic score ('prs') when prs_mode is set")
+        X['PRS'] = [p['prs'] for p in patients]
+        return X[self.feature_names]
+
+    def _encode_genotypes(self, genotypes):
+        feature_names = list(ALZ_GENES.keys())
+        X = np.array([
+            [ALZ_GENES[gene].get(genotype.get(gene, ''), 0.0) for gene in feature_names]
+            for genotype in genotypes
+        ]).reshape(-1, len(feature_names))
+        return pd.DataFrame(X, columns=feature_names)
+
+    def _medication_adjustment(self, genotype, medications):
+        multiplier = 1.0
         risk_modifiers = []
         for med in medications:
             for gene, rules in self.drug_rules.items():
                 if gene in genotype and med in rules:
                     adjustment = rules[med]
-                    adjusted_risk *= (1 + adjustment)
+                    multiplier *= (1 + adjustment)
                     risk_modifiers.append(f"{med}: {adjustment*100:.1f}%")
-        
-        return {
-            'raw_score': proba,
-            'adjusted_risk': adjusted_risk,
-            'risk_category': self._categorize_risk(adjusted_risk),
-            'medication_effects': risk_modifiers
-        }
-    
+        return multiplier, risk_modifiers
+
+    def _interval_bounds(self, X, confidence, n_bootstrap=200, block_size=10_000):
+        """Calibrated (lower, upper) bounds on the positive-class probability.
+
+        The calibrators were fitted on forest-averaged scores, so the spread is
+        taken on the uncalibrated forest mean: the tree columns of the leaf table
+        are resampled n_bootstrap times in one matrix product, and only the
+        quantiles of those means go through each fold's calibrator. Bounds are
+        then averaged across folds, as predict_proba does. Estimators without
+        trees give a zero-width interval at the calibrated probability. Rows are
+        processed block_size at a time so memory does not grow with the cohort.
+        """
+        if self._interval_members is None:
+            self._interval_members = self._build_interval_members()
+
+        tail = (1 - confidence) / 2
+        lower, upper = np.zeros(len(X)), np.zeros(len(X))
+        for predictor, base, calibrator, leaf_table, offsets in self._interval_members:
+            if leaf_table is not None:
+                n_trees = len(offsets)
+                # resampling weights are fixed per forest size so intervals are reproducible
+                picks = np.random.default_rng(n_trees).integers(0, n_trees, (n_bootstrap, n_trees))
+                weights = np.zeros((n_trees, n_bootstrap))
+                np.add.at(weights, (picks, np.arange(n_bootstrap)[:, None]), 1.0 / n_trees)
+
+            for start in range(0, len(X), block_size):
+                rows = X.iloc[start:start + block_size]
+                if leaf_table is None:
+                    lo = hi = predictor.predict_proba(rows)[:, 1]
+                else:
+                    # one gather over all trees instead of calling every tree's predict_proba
+                    tree_probs = leaf_table[base.apply(rows) + offsets]
+                    lo, hi = np.quantile(tree_probs @ weights, [tail, 1 - tail], axis=1)
+                    if calibrator is not None:
+                        lo, hi = calibrator.predict(lo), calibrator.predict(hi)
+                        # a sigmoid calibrator may be decreasing, keep the bounds ordered
+                        lo, hi = np.minimum(lo, hi), np.maximum(lo, hi)
+                lower[start:start + block_size] += np.clip(lo, 0.0, 1.0)
+                upper[start:start + block_size] += np.clip(hi, 0.0, 1.0)
+        n_members = len(self._interval_members)
+        return lower / n_members, upper / n_members
+
+    def _build_interval_members(self):
+        # CalibratedClassifierCV keeps one (estimator, calibrator) pair per fold
+        if hasattr(self.model, 'calibrated_classifiers_'):
+            folds = [
+                (cc, cc.estimator if hasattr(cc, 'estimator') else cc.base_estimator, cc.calibrators[0])
+                for cc in self.model.calibrated_classifiers_
+            ]
+        else:
+            folds = [(self.model, self.model, None)]
+
+        members = []
+        for predictor, base, calibrator in folds:
+            trees = getattr(base, 'estimators_', None)
+            # the calibrator is fitted on decision_function output when the estimator has one,
+            # so leaf probabilities can only be pushed through it for pure probability forests
+            if (trees is not None and not hasattr(base, 'decision_function')
+                    and all(hasattr(t, 'tree_') for t in trees)):
+                # flatten the leaf probabilities of all trees into a single lookup table
+                values = []
+                for tree in trees:
+                    v = tree.tree_.value[:, 0, :]
+                    values.append(v[:, -1] / v.sum(axis=1))
+                sizes = np.array([len(v) for v in values])
+                offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+                members.append((predictor, base, calibrator, np.concatenate(values), offsets))
+            else:
+                members.append((predictor, base, calibrator, None, None))
+        return members
+
     def _categorize_risk(self, risk):
         if risk < 10: return 'Low'
         if risk < 25: return 'Moderate'
@@ -0,0 +1,103 @@
+# genix_alz/src/server.py
+import argparse
+import json
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from risk_calculator import PolygenicRiskEngine
+from drug_checker import PharmacogenomicsAnalyzer
+from report_generator import ClinicalReportGenerator
+
+
+def assess_patient(patient, risk_engine, drug_analyzer, render_pdf=True):
+    """Run the full assessment for one patient, returning (risk, drugs, report size in bytes)"""
+    risk_result = risk_engine.calculate_score(
+        genotype=patient['genotype'],
+        age_group=patient['age_group'],
+        medications=patient.get('medications', [])
+    )
+    drug_result = drug_analyzer.check_interactions(
+        genotype=patient['genotype'],
+        medications=patient.get('medications', [])
+    )
+
+    report_size = 0
+    if render_pdf:
+        reporter = ClinicalReportGenerator(patient, risk_result, drug_result)
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            reporter.generate_pdf(path)
+            report_size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+    return risk_result, drug_result, report_size
+
+
+class AssessmentHandler(BaseHTTPRequestHandler):
+    # the engines are shared by all request threads and set up once in main()
+    risk_engine = None
+    drug_analyzer = None
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/assess':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            patient = json.loads(self.rfile.read(length))
+            render_pdf = parse_qs(url.query).get('report', ['1'])[0] != '0'
+            risk_result, drug_result, report_size = assess_patient(
+                patient, self.risk_engine, self.drug_analyzer, render_pdf=render_pdf
+            )
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self._send_json(200, {'risk': risk_result, 'drugs': drug_result, 'report_bytes': report_size})
+
+    def log_message(self, format, *args):
+        # keep the console quiet under load
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='genix_alz assessment server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    args = parser.parse_args()
+
+    AssessmentHandler.risk_engine = PolygenicRiskEngine()
+    AssessmentHandler.drug_analyzer = PharmacogenomicsAnalyzer()
+
+    server = ThreadingHTTPServer((args.host, args.port), AssessmentHandler)
+    print(f"Serving assessments on http://{args.host}:{args.port}/assess")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+# genix_alz/src/synthetic_cohort.py
+import argparse
+import json
+import os
+import time
+import numpy as np
+from risk_calculator import ALZ_GENES
+
+# Approximate European-ancestry allele frequencies for each locus in ALZ_GENES
+ALLELE_FREQUENCIES = {
+    'APOE': {'e2': 0.08, 'e3': 0.77, 'e4': 0.15},
+    'CLU': {'C': 0.62, 'T': 0.38},
+    'CR1': {'G': 0.80, 'A': 0.20},
+    'BIN1': {'A': 0.60, 'G': 0.40},
+    'PICALM': {'T': 0.64, 'G': 0.36},
+    'ABCA7': {'C': 0.82, 'T': 0.18},
+    'MS4A': {'A': 0.60, 'G': 0.40},
+    'CD33': {'G': 0.70, 'T': 0.30},
+    'CD2AP': {'C': 0.73, 'T': 0.27},
+    'EPHA1': {'A': 0.66, 'G': 0.34},
+    'HLA-DRB5': {'G': 0.84, 'A': 0.16}
+}
+
+# Share of each age group in a memory-clinic style population
+AGE_GROUP_MIX = {'50-59': 0.35, '60-69': 0.30, '70-79': 0.22, '80+': 0.13}
+
+# Fraction of patients taking each medication; anything not listed uses the default
+MEDICATION_PREVALENCE = {
+    'Simvastatin': 0.25,
+    'NSAIDs': 0.20,
+    'Anticholinergics': 0.10,
+    'Warfarin': 0.06,
+    'Estradiol': 0.05
+}
+DEFAULT_MEDICATION_PREVALENCE = 0.05
+
+BINARY_MAGIC = b'GENIXCOH'
+
+# Patients are drawn in independently seeded blocks of this size
+BLOCK_SIZE = 65_536
+
+
+def hardy_weinberg_probabilities(gene):
+    """Genotype probabilities for a locus, in ALZ_GENES order"""
+    freqs = ALLELE_FREQUENCIES[gene]
+    probs = []
+    for label in ALZ_GENES[gene]:
+        a, b = label.split('/') if '/' in label else label
+        probs.append(freqs[a] ** 2 if a == b else 2 * freqs[a] * freqs[b])
+    probs = np.array(probs)
+    return probs / probs.sum()
+
+
+class SyntheticCohortGenerator:
+    def __init__(self, seed=42, drug_rules_path='data/drug_interactions.json'):
+        with open(drug_rules_path) as f:
+            drug_rules = json.load(f)
+
+        self.seed = seed
+        self.genes = list(ALZ_GENES.keys())
+        self.genotype_labels = [list(ALZ_GENES[gene].keys()) for gene in self.genes]
+        self.genotype_probs = [hardy_weinberg_probabilities(gene) for gene in self.genes]
+        self.age_groups = list(AGE_GROUP_MIX.keys())
+        self.age_probs = np.array(list(AGE_GROUP_MIX.values()))
+        self.medications = list(dict.fromkeys(
+            med for rules in drug_rules.values() for med in rules if med != 'alternatives'
+        ))
+        if len(self.medications) > 32:
+            raise ValueError("At most 32 medications fit in the medication bitmask")
+        self.medication_prevalence = np.array([
+            MEDICATION_PREVALENCE.get(med, DEFAULT_MEDICATION_PREVALENCE) for med in self.medications
+        ])
+        self._med_lists = _BitmaskLookup(lambda mask: [
+            med for k, med in enumerate(self.medications) if mask >> k & 1
+        ])
+        self.dtype = np.dtype([
+            ('id', '<u4'),
+            ('age_group', 'u1'),
+            ('genotype', 'u1', (len(self.genes),)),
+            ('medications', '<u4')
+        ])
+        self._intercepts = {}
+
+    def batches(self, n_patients, batch_size=100_000):
+        """Yield the cohort as structured arrays of at most batch_size patients.
+
+        Patients are drawn in fixed blocks of BLOCK_SIZE, each from its own
+        [seed, block] stream, so patient k is the same whatever n_patients and
+        batch_size are; a larger cohort only appends patients.
+        """
+        block_index, block = None, None
+        for start in range(0, n_patients, batch_size):
+            stop = min(start + batch_size, n_patients)
+            parts = []
+            for b in range(start // BLOCK_SIZE, (stop - 1) // BLOCK_SIZE + 1):
+                if b != block_index:
+                    block_index, block = b, self._block(b)
+                offset = b * BLOCK_SIZE
+                parts.append(block[max(start, offset) - offset:min(stop, offset + BLOCK_SIZE) - offset])
+            yield parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _block(self, block_index):
+        rng = np.random.default_rng([self.seed, block_index])
+        med_bits = (1 << np.arange(len(self.medications), dtype=np.uint32)).astype(np.uint32)
+        block = np.empty(BLOCK_SIZE, dtype=self.dtype)
+        block['id'] = np.arange(block_index * BLOCK_SIZE, (block_index + 1) * BLOCK_SIZE, dtype=np.uint32)
+        block['age_group'] = rng.choice(len(self.age_groups), size=BLOCK_SIZE, p=self.age_probs)
+        for j, probs in enumerate(self.genotype_probs):
+            block['genotype'][:, j] = rng.choice(len(probs), size=BLOCK_SIZE, p=probs)
+        taking = rng.random((BLOCK_SIZE, len(self.medications))) < self.medication_prevalence
+        block['medications'] = taking.astype(np.uint32) @ med_bits
+        return block
+
+    def simulate_diagnosis(self, batch, prevalence=0.3):
+        """Draw AD case/control labels for a batch from a logistic liability model.
+
+        Liability is the sum of the ALZ_GENES effect sizes plus 0.5 per age-group
+        step; the intercept is solved once so the expected case fraction over the
+        whole population is `prevalence`. Like the patients, a label depends only
+        on the seed and the patient id.
+        """
+        liability = 0.5 * batch['age_group'].astype(float)
+        for j, gene in enumerate(self.genes):
+            effects = np.array(list(ALZ_GENES[gene].values()))
+            liability += effects[batch['genotype'][:, j]]
+
+        if prevalence not in self._intercepts:
+            self._intercepts[prevalence] = self._solve_intercept(prevalence)
+        intercept = self._intercepts[prevalence]
+
+        ids = batch['id'].astype(np.int64)
+        draws = np.empty(len(batch))
+        for b in np.unique(ids // BLOCK_SIZE).tolist():
+            in_block = ids // BLOCK_SIZE == b
+            uniforms = np.random.default_rng([self.seed, b, 1]).random(BLOCK_SIZE)
+            draws[in_block] = uniforms[ids[in_block] % BLOCK_SIZE]
+        return (draws < 1 / (1 + np.exp(intercept - liability))).astype(np.uint8)
+
+    def _solve_intercept(self, prevalence):
+        # effect sizes have two decimals and age steps are 0.5, so the population
+        # liability distribution is exact on a grid of hundredths: convolve the
+        # per-locus Hardy-Weinberg and age-group distributions, then bisect
+        pmf = np.zeros(50 * (len(self.age_groups) - 1) + 1)
+        pmf[::50] = self.age_probs
+        low = 0
+        for gene, probs in zip(self.genes, self.genotype_probs):
+            steps = np.rint(np.array(list(ALZ_GENES[gene].values())) * 100).astype(int)
+            locus = np.zeros(steps.max() - steps.min() + 1)
+            np.add.at(locus, steps - steps.min(), probs)
+            pmf = np.convolve(pmf, locus)
+            low += steps.min()
+        liability = (low + np.arange(len(pmf))) / 100
+
+        low, high = liability.min() - 20, liability.max() + 20
+        for _ in range(50):
+            intercept = (low + high) / 2
+            if pmf @ (1 / (1 + np.exp(intercept - liability))) > prevalence:
+                low = intercept
+            else:
+                high = intercept
+        return intercept
+
+    def to_records(self, batch):
+        """Decode a batch into patient dicts shaped like data/sample_patient.json"""
+        med_lists = self._med_lists
+        return [
+            {
+                'id': f"SYN-{row['id']:08d}",
+                'age_group': self.age_groups[row['age_group']],
+                'genotype': {
+                    gene: self.genotype_labels[j][code]
+                    for j, (gene, code) in enumerate(zip(self.genes, row['genotype']))
+                },
+                'medications': med_lists[row['medications']]
+            }
+            for row in batch
+        ]
+
+    def write(self, output_path, n_patients, fmt=None, batch_size=100_000):
+        """Stream the cohort to JSONL, CSV or the compact binary format"""
+        fmt = fmt or os.path.splitext(output_path)[1].lstrip('.')
+        writers = {'jsonl': self._format_jsonl, 'csv': self._format_csv}
+        if fmt not in writers and fmt != 'bin':
+            raise ValueError(f"Unsupported format '{fmt}', expected jsonl, csv or bin")
+
+        mode = 'wb' if fmt == 'bin' else 'w'
+        with open(output_path, mode) as f:
+            if fmt == 'bin':
+                self._write_binary_header(f)
+            elif fmt == 'csv':
+                f.write(','.join(['id', 'age_group'] + self.genes + ['medications']) + '\n')
+
+            for batch in self.batches(n_patients, batch_size):
+                if fmt == 'bin':
+                    batch.tofile(f)
+                else:
+                    f.write(writers[fmt](batch))
+        return output_path
+
+    def _format_jsonl(self, batch):
+        # every field is looked up from precomputed JSON fragments and joined with numpy
+        # object-array concatenation, so no per-patient json.dumps is needed
+        ids = self._id_fragments(batch, '{"id": "SYN-', '", ')
+        age = np.array([f'"age_group": {json.dumps(g)}, "genotype": {{' for g in self.age_groups], dtype=object)
+        lines = ids + age[batch['age_group']]
+        for j, gene in enumerate(self.genes):
+            sep = ', ' if j else ''
+            frags = np.array(
+                [f'{sep}{json.dumps(gene)}: {json.dumps(label)}' for label in self.genotype_labels[j]],
+                dtype=object
+            )
+            lines = lines + frags[batch['genotype'][:, j]]
+        meds = self._medication_fragments(batch, lambda meds: f'}}, "medications": {json.dumps(meds)}}}\n')
+        return ''.join(lines + meds)
+
+    def _format_csv(self, batch):
+        lines = self._id_fragments(batch, 'SYN-', ',')
+        lines = lines + np.array(self.age_groups, dtype=object)[batch['age_group']]
+        for j in range(len(self.genes)):
+            frags = np.array([f',{label}' for label in self.genotype_labels[j]], dtype=object)
+            lines = lines + frags[batch['genotype'][:, j]]
+        meds = self._medication_fragments(batch, lambda meds: f",{';'.join(meds)}\n")
+        return ''.join(lines + meds)
+
+    def _id_fragments(self, batch, prefix, suffix):
+        return np.array([f'{prefix}{i:08d}{suffix}' for i in batch['id'].tolist()], dtype=object)
+
+    def _medication_fragments(self, batch, render):
+        masks, inverse = np.unique(batch['medications'], return_inverse=True)
+        med_lists = self._med_lists
+        frags = np.array([render(med_lists[mask]) for mask in masks.tolist()], dtype=object)
+        return frags[inverse.ravel()]
+
+    def _write_binary_header(self, f):
+        header = json.dumps({
+            'genes': self.genes,
+            'genotype_labels': self.genotype_labels,
+            'age_groups': self.age_groups,
+            'medications': self.medications,
+            'dtype': self.dtype.descr
+        }).encode()
+        f.write(BINARY_MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+
+
+class _BitmaskLookup(dict):
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, mask):
+        value = self[mask] = self.build(int(mask))
+        return value
+
+
+def read_binary(path):
+    """Memory-map a cohort written in the binary format, returning (header, records)"""
+    with open(path, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a genix_alz binary cohort file")
+        header_len = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(header_len))
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    offset = len(BINARY_MAGIC) + 4 + header_len
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic genix_alz cohort')
+    parser.add_argument('--n', type=int, default=1_000_000, help='Number of patients')
+    parser.add_argument('--output', type=str, required=True, help='Output path (.jsonl, .csv or .bin)')
+    parser.add_argument('--format', type=str, choices=['jsonl', 'csv', 'bin'], help='Override the format inferred from --output')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--batch-size', type=int, default=100_000, help='Patients generated per batch')
+    parser.add_argument('--rules', type=str, default='data/drug_interactions.json', help='Drug interaction rules file')
+    args = parser.parse_args()
+
+    generator = SyntheticCohortGenerator(seed=args.seed, drug_rules_path=args.rules)
+    start = time.perf_counter()
+    generator.write(args.output, args.n, fmt=args.format, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.n} patients to {args.output} in {elapsed:.1f}s "
+          f"({args.n / max(elapsed, 1e-9) * 60:,.0f} patients/min)")
+
+if __name__ == '__main__':
+    main()
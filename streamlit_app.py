@@ -2,7 +2,10 @@ import streamlit as st
 import os
 import json
 import datetime
+import sys
 import tempfile
+# modules under src/ import their siblings directly (as src/cli.py does), so src/ must be importable too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 from src.risk_calculator import PolygenicRiskEngine, ALZ_GENES
 from src.drug_checker import PharmacogenomicsAnalyzer
 from src.report_generator import ClinicalReportGenerator